@@ -1,7 +1,10 @@
 import os
+import time
 
-from celery import Celery
+from celery import Celery, states
 from celery.schedules import crontab
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_ecommerce_api.settings")
@@ -11,6 +14,30 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
 
 
+TASK_METRIC_STATUSES = {states.SUCCESS: "success", states.RETRY: "retry"}
+
+
+@task_prerun.connect
+def start_task_timer(task, **kwargs):
+    task.request.metrics_started_at = time.perf_counter()
+
+
+@task_postrun.connect
+def record_task_metrics(task, state, **kwargs):
+    # Imported lazily: this module is loaded before Django apps are ready.
+    from orders.metrics import celery_task_duration, celery_task_total
+
+    started_at = getattr(task.request, "metrics_started_at", None)
+    if started_at is not None:
+        celery_task_duration.labels(task_name=task.name).observe(
+            time.perf_counter() - started_at
+        )
+
+    celery_task_total.labels(
+        task_name=task.name, status=TASK_METRIC_STATUSES.get(state, "failed")
+    ).inc()
+
+
 app.conf.beat_schedule = {
     "check-low-stock-every-day": {
         "task": "orders.tasks.check_low_stock",
@@ -33,3 +60,9 @@ app.conf.beat_schedule = {
         "schedule": 60.0,
     },
 }
+
+if settings.FAILED_TASK_BUFFER_ENABLED:
+    app.conf.beat_schedule["flush-failed-tasks"] = {
+        "task": "orders.tasks.flush_failed_tasks",
+        "schedule": 30.0,
+    }
@@ -201,9 +201,21 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Africa/Lagos"
+CELERY_BROKER_TRANSPORT_OPTIONS = {"socket_keepalive": True}
+
+
+# Failed Task Configs
+# Set to True to buffer failed task records per worker process and write them
+# in batches. Buffered records are lost if the process is killed.
+FAILED_TASK_BUFFER_ENABLED = False
 
 
 # Email Configs
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = "noreply@test.com"
 ADMIN_EMAIL = "admin@test.com"
+
+
+# Order Configs
+ORDER_BULK_BATCH_SIZE = 100
+ORDER_STOCK_LOCK_TIMEOUT_MS = 5000
@@ -12,11 +12,7 @@ from orders.models import (
     FailedTask,
 )
 
-admin.site.register(Order)
-admin.site.register(OrderItem)
-admin.site.register(Product)
-admin.site.register(EmailLog)
-admin.site.register(WebhookEvent)
+admin.site.register([Order, OrderItem, Product, EmailLog, WebhookEvent])
 
 
 @admin.register(DailySalesReport)
@@ -31,10 +27,19 @@ class DailySalesReportAdmin(admin.ModelAdmin):
         "created_at",
         "updated_at",
     ]
+    actions = ["regenerate_reports"]
 
     def has_add_permission(self, request):
         return False
 
+    @admin.action(description="Regenerate selected reports")
+    def regenerate_reports(self, request, queryset):
+        dates = list(queryset.values_list("date", flat=True))
+        for date in dates:
+            DailySalesReport.generate_for(date)
+
+        self.message_user(request, f"Regenerated {len(dates)} reports")
+
 
 @admin.register(LowStockAlert)
 class LowStockAlertAdmin(admin.ModelAdmin):
@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+PRODUCT_LIST_VERSION_KEY = "products:ver"
+
+
+def initial_product_list_version():
+    # Microsecond clock, so a counter lost to eviction restarts ahead of any
+    # version whose pages may still be cached.
+    return time.time_ns() // 1000
+
+
+def product_list_version():
+    return cache.get_or_set(
+        PRODUCT_LIST_VERSION_KEY, initial_product_list_version, timeout=None
+    )
+
+
+def product_list_key(limit, offset):
+    return f"products:list:active:v{product_list_version()}:{limit}:{offset}"
+
+
+def bump_product_list_version():
+    try:
+        cache.incr(PRODUCT_LIST_VERSION_KEY)
+    except ValueError:
+        cache.set(
+            PRODUCT_LIST_VERSION_KEY, initial_product_list_version(), timeout=None
+        )
+
+
+def invalidate_product_list():
+    """Move product list readers to fresh keys once the current transaction commits"""
+    transaction.on_commit(bump_product_list_version)
@@ -1,7 +1,9 @@
 from django.core.management.base import BaseCommand
 from orders.models import FailedTask
 from django.utils import timezone
-from celery import current_app
+from celery import current_app, group
+
+RETRY_BATCH_SIZE = 500
 
 
 class Command(BaseCommand):
@@ -24,17 +26,51 @@ class Command(BaseCommand):
                 )
 
         elif options["all"]:
-            failed_tasks = FailedTask.objects.filter(retried=False)
-            count = failed_tasks.count()
-
-            for failed_task in failed_tasks:
-                self.retry_task(failed_task)
-
-            self.stdout.write(self.style.SUCCESS(f"Retried {count} tasks"))
+            failed_tasks = FailedTask.objects.filter(retried=False).only(
+                "id", "task_name", "task_id", "args", "kwargs"
+            )
+            self.retry_all(failed_tasks.iterator(chunk_size=RETRY_BATCH_SIZE))
 
         else:
             self.stdout.write(self.style.WARNING("Use --task-id or --all"))
 
+    def retry_all(self, failed_tasks):
+        retried_count = 0
+        signatures = []
+        retried_ids = []
+
+        for failed_task in failed_tasks:
+            task = current_app.tasks.get(failed_task.task_name)
+
+            if task:
+                signatures.append(task.s(*failed_task.args, **failed_task.kwargs))
+                retried_ids.append(failed_task.id)
+            else:
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"Task {failed_task.task_name} not found in registry"
+                    )
+                )
+
+            if len(signatures) >= RETRY_BATCH_SIZE:
+                retried_count += self.enqueue_batch(signatures, retried_ids)
+                signatures = []
+                retried_ids = []
+
+        retried_count += self.enqueue_batch(signatures, retried_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Retried {retried_count} tasks"))
+
+    def enqueue_batch(self, signatures, retried_ids):
+        if not signatures:
+            return 0
+
+        group(signatures).apply_async()
+        FailedTask.objects.filter(id__in=retried_ids).update(
+            retried=True, retried_at=timezone.now()
+        )
+        return len(retried_ids)
+
     def retry_task(self, failed_task):
         task = current_app.tasks.get(failed_task.task_name)
 
@@ -43,7 +79,7 @@ class Command(BaseCommand):
 
             failed_task.retried = True
             failed_task.retried_at = timezone.now()
-            failed_task.save()
+            failed_task.save(update_fields=["retried", "retried_at"])
 
             self.stdout.write(self.style.SUCCESS(f"Retried task {failed_task.task_id}"))
         else:
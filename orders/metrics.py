@@ -1,7 +1,15 @@
+from django.conf import settings
 from prometheus_client import Counter, Histogram, Gauge
 
+from orders.models import Order
+from orders.utils.logging import logger
+
+ORDER_STATUSES = frozenset(status for status, _ in Order.STATUS_CHOICES)
+
 orders_created_total = Counter(
-    "orders_created_total", "Total number of orders created", ["status"]
+    "orders_created_total",
+    "Total number of orders created, by status (one of Order.STATUS_CHOICES)",
+    ["status"],
 )
 
 order_value_total = Counter(
@@ -22,7 +30,7 @@ celery_task_duration = Histogram(
     "celery_task_duration_seconds",
     "Celery task execution time",
     ["task_name"],
-    buckets=[0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0],
+    buckets=[0.5, 2.5, 10.0, 60.0],
 )
 
 celery_task_total = Counter(
@@ -35,12 +43,21 @@ low_stock_products_gauge = Gauge(
     "low_stock_products_total", "Current number of low stock products"
 )
 
-redis_lock_acquisitions = Counter(
-    "redis_lock_acquisitions_total", "Total Redis lock acquisitions", ["status"]
-)
-
 stock_quantity_gauge = Gauge(
-    "product_stock_quantity",
-    "Current stock quantity per product",
-    ["product_id", "product_name"],
+    "product_stock_quantity", "Current stock quantity per product", ["product_id"]
 )
+
+
+def record_order_created(status):
+    """Count a created order, keeping the status label within Order.STATUS_CHOICES"""
+    if status not in ORDER_STATUSES:
+        if settings.DEBUG:
+            raise ValueError(f"Unknown order status for metrics: {status!r}")
+
+        logger.warning(
+            "Dropped orders_created_total sample with unknown status",
+            extra={"status": status, "action": "metric_label_rejected"},
+        )
+        return
+
+    orders_created_total.labels(status=status).inc()
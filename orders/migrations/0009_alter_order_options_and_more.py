@@ -0,0 +1,55 @@
+# Generated by Django 5.2.8 on 2026-10-14 08:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0008_failedtask"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="order",
+            options={"ordering": ["-created_at"]},
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["status"], name="orders_orde_status_c6dd84_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "status"], name="orders_orde_user_id_02a211_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["-created_at"], name="orders_orde_created_f0ce29_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["payment_status", "-created_at"],
+                name="orders_orde_payment_8bdf8b_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="order",
+            name="payment_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("paid", "Paid"),
+                    ("failed", "Failed"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-14 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0009_alter_order_options_and_more"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="webhookcleanuplog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("running", "Running"),
+                    ("success", "Success"),
+                    ("failed", "Failed"),
+                ],
+                default="success",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-14 09:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0010_alter_webhookcleanuplog_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="failedtask",
+            name="failed_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
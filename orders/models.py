@@ -1,6 +1,10 @@
 import uuid
+from datetime import datetime, time, timedelta
+
 from django.conf import settings
 from django.db import models
+from django.db.models import Count, F, Sum
+from django.utils import timezone
 
 
 class Product(models.Model):
@@ -58,7 +62,6 @@ class Order(models.Model):
         max_length=20,
         choices=PAYMENT_STATUS_CHOICES,
         default=PAYMENT_PENDING,
-        db_index=True,
     )
     payment_reference = models.CharField(
         max_length=255, unique=True, null=True, blank=True
@@ -67,21 +70,23 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status"]),
+            models.Index(fields=["user", "status"]),
+            models.Index(fields=["-created_at"]),
+            models.Index(fields=["payment_status", "-created_at"]),
+        ]
+        ordering = ["-created_at"]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
-
-class Meta:
-    indexes = [
-        models.Index(fields=["status"]),
-        models.Index(fields=["user", "status"]),
-        models.Index(fields=["-created_at"]),
-    ]
-    ordering = ["-created_at"]
-
     def calculate_total(self):
         """Recalculate order total from items"""
-        self.total = sum(item.price * item.quantity for item in self.items.all())
+        self.total = (
+            self.items.aggregate(total=Sum(F("price") * F("quantity")))["total"] or 0
+        )
         self.save(update_fields=["total"])
 
 
@@ -162,6 +167,35 @@ class DailySalesReport(models.Model):
     def __str__(self):
         return f"Sales Report - {self.date}"
 
+    @staticmethod
+    def paid_orders(date):
+        """Paid orders created on date"""
+        # A range on created_at, unlike created_at__date, can use its index.
+        start = timezone.make_aware(datetime.combine(date, time.min))
+        return Order.objects.filter(
+            created_at__gte=start,
+            created_at__lt=start + timedelta(days=1),
+            payment_status=Order.PAYMENT_PAID,
+        )
+
+    @classmethod
+    def generate_for(cls, date):
+        """Aggregate paid orders created on date into that day's report"""
+        stats = cls.paid_orders(date).aggregate(
+            total_orders=Count("id"), total_revenue=Sum("total")
+        )
+
+        report, _ = cls.objects.update_or_create(
+            date=date,
+            defaults={
+                "total_orders": stats["total_orders"],
+                "total_revenue": stats["total_revenue"] or 0,
+                "status": "completed",
+                "generated_at": timezone.now(),
+            },
+        )
+        return report
+
 
 class LowStockAlert(models.Model):
     product = models.ForeignKey(
@@ -190,6 +224,7 @@ class WebhookCleanupLog(models.Model):
     status = models.CharField(
         max_length=20,
         choices=[
+            ("running", "Running"),
             ("success", "Success"),
             ("failed", "Failed"),
         ],
@@ -211,7 +246,7 @@ class FailedTask(models.Model):
     kwargs = models.JSONField()
     exception = models.TextField()
     traceback = models.TextField()
-    failed_at = models.DateTimeField(auto_now_add=True)
+    failed_at = models.DateTimeField(default=timezone.now)
     retried = models.BooleanField(default=False)
     retried_at = models.DateTimeField(null=True, blank=True)
 
@@ -0,0 +1,11 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class ProductPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 200
+
+
+class OrderPagination(CursorPagination):
+    ordering = "-created_at"
+    page_size = 50
@@ -1,32 +1,38 @@
 import uuid
 
-from django.core.cache import cache
-from django.db import transaction
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
+from orders.cache import invalidate_product_list
 from orders.models import Order, OrderItem, Product
 from orders.tasks import send_order_confirmation_email
 from orders.utils.logging import logger
 from orders.metrics import (
-    orders_created_total,
     order_value_total,
     order_creation_duration,
-    redis_lock_acquisitions,
+    record_order_created,
     stock_quantity_gauge,
 )
 
+# Postgres SQLSTATE raised when lock_timeout expires.
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def order_items_prefetch():
+    return Prefetch(
+        "items",
+        queryset=OrderItem.objects.select_related("product").only(
+            "id", "order", "product", "quantity", "price", "product__name"
+        ),
+    )
+
 
 class OrderItemInputSerializer(serializers.Serializer):
     product_id = serializers.UUIDField()
     quantity = serializers.IntegerField(min_value=1)
 
-    def validate_product_id(self, value):
-        if not Product.objects.filter(id=value, is_active=True).exists():
-            raise serializers.ValidationError(
-                f"Product {value} does not exist or is inactive"
-            )
-        return value
-
 
 class OrderItemSerializer(serializers.ModelSerializer):
     subtotal = serializers.SerializerMethodField()
@@ -43,7 +49,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
             "price",
             "subtotal",
         ]
-        read_only_fields = ["id", "price", "subtotal"]
+        read_only_fields = fields
 
     def get_subtotal(self, obj):
         return obj.subtotal
@@ -65,7 +71,7 @@ class OrderSerializer(serializers.ModelSerializer):
             "updated_at",
             "items",
         ]
-        read_only_fields = ["id", "total", "created_at", "updated_at", "user"]
+        read_only_fields = fields
 
 
 class OrderCreateSerializer(serializers.ModelSerializer):
@@ -79,7 +85,37 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     def validate_items(self, value):
         if not value:
             raise serializers.ValidationError("Order must have at least one item")
-        return value
+
+        # Lines for the same product are merged so each product maps to one
+        # OrderItem row and its stock is checked against the combined quantity.
+        quantities = {}
+        for item in value:
+            product_id = item["product_id"]
+            quantities[product_id] = quantities.get(product_id, 0) + item["quantity"]
+
+        product_ids = quantities.keys()
+        existing_ids = set(
+            Product.objects.filter(id__in=product_ids, is_active=True).values_list(
+                "id", flat=True
+            )
+        )
+        missing_ids = product_ids - existing_ids
+        if missing_ids:
+            raise serializers.ValidationError(
+                [
+                    f"Product {product_id} does not exist or is inactive"
+                    for product_id in sorted(missing_ids)
+                ]
+            )
+
+        return [
+            {"product_id": product_id, "quantity": quantity}
+            for product_id, quantity in quantities.items()
+        ]
+
+    def to_representation(self, instance):
+        prefetch_related_objects([instance], order_items_prefetch())
+        return OrderSerializer(instance, context=self.context).data
 
     def create(self, validated_data):
         import time
@@ -99,38 +135,52 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             },
         )
 
-        locks_acquired = []
-
         try:
-            for product_id in product_ids:
-                lock_key = f"product_lock:{product_id}"
-                lock = cache.lock(lock_key, timeout=10, blocking_timeout=5)
-
-                acquired = lock.acquire(blocking=True)
-                if acquired:
-                    redis_lock_acquisitions.labels(status="success").inc()
-                else:
-                    redis_lock_acquisitions.labels(status="failed").inc()
+            with transaction.atomic():
+                if connection.vendor == "postgresql":
+                    # Bound how long we queue behind other orders holding the
+                    # same stock rows instead of pinning the worker.
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT set_config('lock_timeout', %s, true)",
+                            [f"{settings.ORDER_STOCK_LOCK_TIMEOUT_MS}ms"],
+                        )
+
+                # Lock every product row in one query, in primary key order, so
+                # concurrent orders over the same products queue instead of
+                # deadlocking.
+                try:
+                    products = {
+                        p.id: p
+                        for p in Product.objects.select_for_update()
+                        .filter(id__in=product_ids, is_active=True)
+                        .order_by("id")
+                    }
+                except OperationalError as e:
+                    if getattr(e.__cause__, "pgcode", None) != LOCK_NOT_AVAILABLE:
+                        raise
                     logger.warning(
-                        "Failed to acquire lock",
-                        extra={
-                            "request_id": request_id,
-                            "product_id": str(product_id),
-                            "action": "lock_failed",
-                        },
+                        "Stock lock timed out",
+                        extra={"request_id": request_id, "action": "lock_failed"},
                     )
                     raise serializers.ValidationError(
                         "Product is currently being ordered. Please try again."
                     )
-                locks_acquired.append(lock)
 
-            with transaction.atomic():
-                products = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
+                missing = set(product_ids) - products.keys()
+                if missing:
+                    raise serializers.ValidationError(
+                        f"Products {', '.join(map(str, missing))} do not exist "
+                        "or are inactive"
+                    )
 
-                for item_data in items_data:
-                    product = products[item_data["product_id"]]
-                    quantity = item_data["quantity"]
+                priced_items = [
+                    (products[item_data["product_id"]], item_data["quantity"])
+                    for item_data in items_data
+                ]
 
+                total = 0
+                for product, quantity in priced_items:
                     if product.stock_quantity < quantity:
                         logger.warning(
                             "Insufficient stock",
@@ -148,38 +198,50 @@ class OrderCreateSerializer(serializers.ModelSerializer):
                             f"Available: {product.stock_quantity}, Requested: {quantity}"
                         )
 
-                payment_reference = f"ORD-{uuid.uuid4().hex[:12].upper()}"
+                    product.stock_quantity -= quantity
+                    total += product.price * quantity
+
+                payment_reference = f"ORD-{uuid.uuid4().hex.upper()}"
                 order = Order.objects.create(
-                    **validated_data, payment_reference=payment_reference
+                    **validated_data, payment_reference=payment_reference, total=total
                 )
 
-                total = 0
-                for item_data in items_data:
-                    product = products[item_data["product_id"]]
-                    quantity = item_data["quantity"]
-                    price = product.price
-
-                    product.stock_quantity -= quantity
-                    product.save(update_fields=["stock_quantity"])
-
-                    stock_quantity_gauge.labels(
-                        product_id=str(product.id), product_name=product.name
-                    ).set(product.stock_quantity)
+                batch_size = settings.ORDER_BULK_BATCH_SIZE
+                Product.objects.bulk_update(
+                    list(products.values()), ["stock_quantity"], batch_size=batch_size
+                )
+                # bulk_update sends no post_save, so cached product pages
+                # would keep showing the old stock.
+                invalidate_product_list()
+                OrderItem.objects.bulk_create(
+                    [
+                        OrderItem(
+                            order=order,
+                            product=product,
+                            quantity=quantity,
+                            price=product.price,
+                        )
+                        for product, quantity in priced_items
+                    ],
+                    batch_size=batch_size,
+                )
 
-                    OrderItem.objects.create(
-                        order=order, product=product, quantity=quantity, price=price
+                for product in products.values():
+                    stock_quantity_gauge.labels(product_id=str(product.id)).set(
+                        product.stock_quantity
                     )
-                    total += price * quantity
-
-                order.total = total
-                order.save(update_fields=["total"])
 
-                orders_created_total.labels(status=order.status).inc()
+                record_order_created(order.status)
                 order_value_total.labels(payment_status=order.payment_status).inc(
                     float(order.total)
                 )
 
-                send_order_confirmation_email.delay(str(order.id))
+                # Enqueue only once the order is committed, so the worker
+                # cannot look it up before it exists.
+                order_id = str(order.id)
+                transaction.on_commit(
+                    lambda: send_order_confirmation_email.delay(order_id)
+                )
 
                 duration = time.time() - start_time
                 order_creation_duration.observe(duration)
@@ -227,20 +289,6 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             )
             raise
 
-        finally:
-            for lock in locks_acquired:
-                try:
-                    lock.release()
-                except Exception as e:
-                    logger.error(
-                        "Failed to release lock",
-                        extra={
-                            "request_id": request_id,
-                            "error": str(e),
-                            "action": "lock_release_failed",
-                        },
-                    )
-
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from orders.cache import invalidate_product_list
+from orders.models import Product
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_list_on_change(sender, **kwargs):
+    invalidate_product_list()
@@ -1,3 +1,745 @@
-from django.test import TestCase
+import csv
+import json
+import time
+import uuid
+from collections import deque
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from celery.exceptions import MaxRetriesExceededError, Retry
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from orders import tasks
+from orders.cache import (
+    PRODUCT_LIST_VERSION_KEY,
+    bump_product_list_version,
+    invalidate_product_list,
+    product_list_key,
+    product_list_version,
+)
+from orders.serializers import ProductSerializer
+from orders.models import (
+    DailySalesReport,
+    FailedTask,
+    Order,
+    OrderItem,
+    Product,
+    WebhookEvent,
+)
+from users.models import User
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False)
+class OrderCreateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@test.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            name="Widget", price=Decimal("10.00"), stock_quantity=5
+        )
+
+        patcher = mock.patch("orders.serializers.send_order_confirmation_email.delay")
+        self.send_email = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_order(self, items):
+        return self.client.post("/orders/", {"items": items}, format="json")
+
+    def line(self, product, quantity):
+        return {"product_id": str(product.id), "quantity": quantity}
+
+    def test_order_decrements_locked_stock(self):
+        response = self.create_order([self.line(self.product, 2)])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Decimal(response.data["total"]), Decimal("20.00"))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 3)
+
+    def test_insufficient_stock_leaves_stock_unchanged(self):
+        other = Product.objects.create(
+            name="Gadget", price=Decimal("5.00"), stock_quantity=10
+        )
+
+        response = self.create_order([self.line(other, 2), self.line(self.product, 6)])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Not enough stock for Widget", str(response.data))
+        self.product.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+        self.assertEqual(other.stock_quantity, 10)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_confirmation_email_enqueued_only_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.create_order([self.line(self.product, 1)])
+            self.send_email.assert_not_called()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.send_email.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        self.send_email.assert_called_once_with(response.data["id"])
+
+    def test_confirmation_email_not_enqueued_when_order_fails(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.create_order([self.line(self.product, 6)])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(callbacks, [])
+
+    def test_stock_gauge_is_keyed_by_product_id_only(self):
+        self.create_order([self.line(self.product, 2)])
+
+        self.assertEqual(
+            REGISTRY.get_sample_value(
+                "product_stock_quantity", {"product_id": str(self.product.id)}
+            ),
+            3,
+        )
+        self.assertIsNone(REGISTRY.get_sample_value("product_info"))
+
+    def test_duplicate_lines_are_merged_into_one_item(self):
+        response = self.create_order(
+            [self.line(self.product, 2), self.line(self.product, 2)]
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        item = OrderItem.objects.get()
+        self.assertEqual(item.quantity, 4)
+        self.assertEqual(Decimal(response.data["total"]), Decimal("40.00"))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 1)
+
+    def test_duplicate_lines_are_checked_against_combined_stock(self):
+        response = self.create_order(
+            [self.line(self.product, 3), self.line(self.product, 3)]
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Requested: 6", str(response.data))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+        self.assertFalse(Order.objects.exists())
+
+    def test_missing_and_inactive_products_rejected_in_one_query(self):
+        inactive = Product.objects.create(
+            name="Retired", price=Decimal("1.00"), stock_quantity=5, is_active=False
+        )
+        missing_id = uuid.uuid4()
+
+        with self.assertNumQueries(1):
+            response = self.create_order(
+                [
+                    self.line(self.product, 1),
+                    self.line(inactive, 1),
+                    {"product_id": str(missing_id), "quantity": 1},
+                ]
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = [str(error) for error in response.data["items"]]
+        self.assertEqual(len(errors), 2)
+        self.assertIn(f"Product {inactive.id} does not exist or is inactive", errors)
+        self.assertIn(f"Product {missing_id} does not exist or is inactive", errors)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 5)
+
+
+class RetryFailedTasksCommandTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch("orders.management.commands.retry_failed_tasks.group")
+        self.group = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def failed_task(
+        self, task_id, task_name="orders.tasks.send_order_confirmation_email"
+    ):
+        return FailedTask.objects.create(
+            task_name=task_name,
+            task_id=task_id,
+            args=[task_id],
+            kwargs={},
+            exception="boom",
+            traceback="",
+        )
+
+    def test_all_enqueues_one_group_and_marks_tasks_retried(self):
+        self.failed_task("a")
+        self.failed_task("b")
+        self.failed_task("c", task_name="orders.tasks.unknown")
+
+        out = StringIO()
+        call_command("retry_failed_tasks", "--all", stdout=out)
+
+        self.group.assert_called_once()
+        signatures = self.group.call_args.args[0]
+        self.assertEqual(sorted(sig.args[0] for sig in signatures), ["a", "b"])
+        self.group.return_value.apply_async.assert_called_once_with()
+        self.assertEqual(
+            set(
+                FailedTask.objects.filter(retried=True).values_list(
+                    "task_id", flat=True
+                )
+            ),
+            {"a", "b"},
+        )
+        self.assertIn("Task orders.tasks.unknown not found in registry", out.getvalue())
+        self.assertIn("Retried 2 tasks", out.getvalue())
+
+    def test_all_skips_tasks_already_retried(self):
+        self.failed_task("a")
+        FailedTask.objects.filter(task_id="a").update(retried=True)
+
+        out = StringIO()
+        call_command("retry_failed_tasks", "--all", stdout=out)
+
+        self.group.assert_not_called()
+        self.assertIn("Retried 0 tasks", out.getvalue())
+
+    def test_all_streams_tasks_in_batches(self):
+        for task_id in "abcde":
+            self.failed_task(task_id)
+
+        with mock.patch(
+            "orders.management.commands.retry_failed_tasks.RETRY_BATCH_SIZE", 2
+        ):
+            call_command("retry_failed_tasks", "--all", stdout=StringIO())
+
+        batch_sizes = [len(call.args[0]) for call in self.group.call_args_list]
+        self.assertEqual(batch_sizes, [2, 2, 1])
+        self.assertFalse(FailedTask.objects.filter(retried=False).exists())
+
+
+class DailySalesReportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@test.com", "password")
+        self.day = date(2026, 3, 10)
+        self.start = datetime(2026, 3, 10, tzinfo=dt_timezone.utc)
+
+    def paid_order(self, created_at, total):
+        order = Order.objects.create(
+            user=self.user, total=Decimal(total), payment_status=Order.PAYMENT_PAID
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        return order
+
+    def test_paid_orders_covers_the_half_open_day(self):
+        first = self.paid_order(self.start, "10.00")
+        last = self.paid_order(self.start + timedelta(days=1, microseconds=-1), "5.00")
+        self.paid_order(self.start - timedelta(microseconds=1), "1.00")
+        self.paid_order(self.start + timedelta(days=1), "1.00")
+        Order.objects.create(user=self.user, total=Decimal("99.00"))
+
+        self.assertEqual(set(DailySalesReport.paid_orders(self.day)), {first, last})
+
+    def test_task_writes_the_report_in_place(self):
+        yesterday = timezone.now().date() - timedelta(days=1)
+        start = datetime.combine(yesterday, datetime.min.time(), dt_timezone.utc)
+        self.paid_order(start + timedelta(hours=1), "10.00")
+        self.paid_order(start + timedelta(hours=2), "15.50")
+        failed = DailySalesReport.objects.create(date=yesterday, status="failed")
+
+        with mock.patch("orders.tasks.send_email") as send_email:
+            tasks.generate_daily_sales_report()
+
+        report = DailySalesReport.objects.get()
+        self.assertEqual(report.pk, failed.pk)
+        self.assertEqual(report.status, "completed")
+        self.assertEqual(report.total_orders, 2)
+        self.assertEqual(report.total_revenue, Decimal("25.50"))
+        self.assertIsNotNone(report.generated_at)
+        send_email.assert_called_once()
+
+    def test_task_skips_a_completed_report(self):
+        yesterday = timezone.now().date() - timedelta(days=1)
+        DailySalesReport.objects.create(date=yesterday, status="completed")
+
+        with mock.patch("orders.tasks.send_email") as send_email:
+            result = tasks.generate_daily_sales_report()
+
+        self.assertEqual(result, f"Report already exists for {yesterday}")
+        send_email.assert_not_called()
+
+    def test_task_marks_the_report_failed_when_sending_fails(self):
+        yesterday = timezone.now().date() - timedelta(days=1)
+
+        with mock.patch("orders.tasks.send_email", side_effect=OSError("smtp down")):
+            with self.assertRaises(OSError):
+                tasks.generate_daily_sales_report()
+
+        report = DailySalesReport.objects.get()
+        self.assertEqual(report.date, yesterday)
+        self.assertEqual(report.status, "failed")
+
+
+@override_settings(FAILED_TASK_BUFFER_ENABLED=True)
+class FailedTaskBufferTests(TestCase):
+    def setUp(self):
+        tasks._failed_task_buffer.clear()
+        self.addCleanup(tasks._failed_task_buffer.clear)
+        tasks._failed_task_last_flush = time.monotonic()
+
+    def failed_task(self, task_id):
+        return FailedTask(
+            task_name="orders.tasks.send_order_confirmation_email",
+            task_id=task_id,
+            args=[],
+            kwargs={},
+            exception="boom",
+            traceback="",
+        )
+
+    def test_on_failure_buffers_the_record_with_its_failure_time(self):
+        before = timezone.now()
+        tasks.send_order_confirmation_email.on_failure(
+            ValueError("boom"), "task-1", ["order-1"], {}, None
+        )
+
+        self.assertFalse(FailedTask.objects.exists())
+        (buffered,) = tasks._failed_task_buffer
+        self.assertEqual(buffered.task_id, "task-1")
+        self.assertGreaterEqual(buffered.failed_at, before)
+
+        tasks.flush_failed_task_buffer()
+        self.assertEqual(FailedTask.objects.get().failed_at, buffered.failed_at)
+
+    def test_buffer_flushes_once_full(self):
+        with mock.patch("orders.tasks.FAILED_TASK_FLUSH_SIZE", 2):
+            tasks.buffer_failed_task(self.failed_task("a"))
+            self.assertFalse(FailedTask.objects.exists())
+
+            tasks.buffer_failed_task(self.failed_task("b"))
+
+        self.assertEqual(FailedTask.objects.count(), 2)
+        self.assertFalse(tasks._failed_task_buffer)
+
+    def test_postrun_flushes_once_the_interval_has_passed(self):
+        tasks.buffer_failed_task(self.failed_task("a"))
+
+        tasks.flush_failed_tasks_when_due()
+        self.assertFalse(FailedTask.objects.exists())
+
+        tasks._failed_task_last_flush -= tasks.FAILED_TASK_FLUSH_INTERVAL
+        tasks.flush_failed_tasks_when_due()
+        self.assertEqual(FailedTask.objects.get().task_id, "a")
+
+    def test_failed_flush_rebuffers_records_in_order(self):
+        tasks.buffer_failed_task(self.failed_task("a"))
+        tasks.buffer_failed_task(self.failed_task("b"))
+
+        with mock.patch.object(
+            FailedTask.objects, "bulk_create", side_effect=DatabaseError("down")
+        ):
+            with self.assertRaises(DatabaseError):
+                tasks.flush_failed_task_buffer()
+
+        self.assertEqual([t.task_id for t in tasks._failed_task_buffer], ["a", "b"])
+
+    def test_failed_flush_logs_records_dropped_from_a_full_buffer(self):
+        buffer = deque(maxlen=3)
+
+        def fail_while_more_arrive(batch, **kwargs):
+            buffer.extend([self.failed_task("c"), self.failed_task("d")])
+            raise DatabaseError("down")
+
+        with mock.patch.object(tasks, "_failed_task_buffer", buffer):
+            tasks.buffer_failed_task(self.failed_task("a"))
+            tasks.buffer_failed_task(self.failed_task("b"))
+
+            with (
+                mock.patch.object(
+                    FailedTask.objects,
+                    "bulk_create",
+                    side_effect=fail_while_more_arrive,
+                ),
+                self.assertLogs("orders.tasks", "ERROR") as logs,
+            ):
+                with self.assertRaises(DatabaseError):
+                    tasks.flush_failed_task_buffer()
+
+        self.assertEqual([t.task_id for t in buffer], ["a", "b", "c"])
+        self.assertIn("dropped 1 failed task records", logs.output[-1])
+
+
+class ProcessPaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@test.com", "password")
+        self.order = Order.objects.create(
+            user=self.user, total=Decimal("10.00"), payment_reference="ORD-1"
+        )
+
+        patcher = mock.patch.object(tasks.process_payment_webhook, "retry")
+        self.retry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process(self, event_id="evt-1", status="success"):
+        return tasks.process_payment_webhook(event_id, "ORD-1", status, "10.00")
+
+    def test_marks_the_order_paid(self):
+        self.process()
+
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, Order.PAYMENT_PAID)
+        self.assertEqual(self.order.status, Order.STATUS_CONFIRMED)
+        self.assertTrue(WebhookEvent.objects.get(event_id="evt-1").processed)
+
+    def test_locked_order_retries_on_its_own_budget(self):
+        self.retry.side_effect = Retry()
+
+        # A skipped locked row looks like a missing one to first().
+        with mock.patch.object(QuerySet, "first", return_value=None):
+            with self.assertRaises(Retry):
+                self.process()
+
+        self.retry.assert_called_once_with(
+            countdown=5, max_retries=tasks.WEBHOOK_LOCKED_MAX_RETRIES
+        )
+        self.assertFalse(WebhookEvent.objects.filter(processed=True).exists())
+
+    def test_exhausted_lock_retries_are_not_retried_as_failures(self):
+        self.retry.side_effect = MaxRetriesExceededError()
+
+        with mock.patch.object(QuerySet, "first", return_value=None):
+            with self.assertRaises(MaxRetriesExceededError):
+                self.process()
+
+        self.retry.assert_called_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False)
+class ProductListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("buyer", "buyer@test.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            name="Widget", price=Decimal("10.00"), stock_quantity=3
+        )
+
+    def listed_stock(self):
+        response = self.client.get("/orders/products/")
+        return [product["stock_quantity"] for product in response.json()["results"]]
+
+    def test_page_matches_the_serializer_output(self):
+        response = self.client.get("/orders/products/")
+
+        expected = JSONRenderer().render(
+            ProductSerializer([self.product], many=True).data
+        )
+        self.assertEqual(response.json()["results"], json.loads(expected))
+
+    def test_order_invalidates_cached_stock(self):
+        self.assertEqual(self.listed_stock(), [3])
+
+        with (
+            mock.patch("orders.serializers.send_order_confirmation_email.delay"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            response = self.client.post(
+                "/orders/",
+                {"items": [{"product_id": str(self.product.id), "quantity": 1}]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.listed_stock(), [2])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False)
+class PaymentWebhookViewTests(TestCase):
+    url = "/orders/webhooks/payment/"
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        patcher = mock.patch("orders.views.process_payment_webhook.delay")
+        self.delay = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **overrides):
+        payload = {
+            "event_id": "evt-1",
+            "reference": "ORD-1",
+            "status": "success",
+            "amount": "10.00",
+            **overrides,
+        }
+        return self.client.post(self.url, payload, format="json")
+
+    def test_duplicate_event_is_not_enqueued_again(self):
+        first = self.post()
+        second = self.post()
+
+        self.assertEqual(first.data["message"], "Webhook received")
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.data["message"], "Webhook already received")
+        self.delay.assert_called_once_with("evt-1", "ORD-1", "success", "10.00")
+
+    def test_failed_enqueue_releases_the_claim(self):
+        self.delay.side_effect = ConnectionError("broker down")
+        with self.assertRaises(ConnectionError):
+            self.post()
+
+        self.delay.side_effect = None
+        response = self.post()
+
+        self.assertEqual(response.data["message"], "Webhook received")
+        self.assertEqual(self.delay.call_count, 2)
+
+    def test_event_id_is_derived_from_the_payload_when_missing(self):
+        self.post(event_id="")
+        retry = self.post(event_id="")
+        self.post(event_id="", status="failed")
+
+        self.assertEqual(retry.data["message"], "Webhook already received")
+        self.assertEqual(self.delay.call_count, 2)
+        success_id, failed_id = [call.args[0] for call in self.delay.call_args_list]
+        self.assertEqual(len(success_id), 32)
+        self.assertNotEqual(success_id, failed_id)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user("buyer", "buyer@test.com", "password")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            name="Widget", price=Decimal("10.00"), stock_quantity=5
+        )
+        self.order = Order.objects.create(user=self.user, total=Decimal("10.00"))
+        OrderItem.objects.create(
+            order=self.order, product=self.product, quantity=1, price=Decimal("10.00")
+        )
+
+    def test_order_list_returns_304_for_matching_etag(self):
+        response = self.client.get("/orders/")
+        etag = response["ETag"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        not_modified = self.client.get("/orders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], etag)
+
+    def test_order_list_etag_changes_when_an_order_changes(self):
+        etag = self.client.get("/orders/")["ETag"]
+
+        self.order.status = Order.STATUS_SHIPPED
+        self.order.save()
+
+        response = self.client.get("/orders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_order_list_etag_changes_when_a_product_is_renamed(self):
+        etag = self.client.get("/orders/")["ETag"]
+
+        self.product.name = "Widget Pro"
+        self.product.save()
+
+        response = self.client.get("/orders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()["results"][0]["items"][0]["product_name"], "Widget Pro"
+        )
+
+    def test_order_detail_returns_304_for_matching_etag(self):
+        url = f"/orders/{self.order.id}/"
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_is_not_shared_between_users(self):
+        etag = self.client.get("/orders/")["ETag"]
+
+        other = User.objects.create_user("other", "other@test.com", "password")
+        self.client.force_authenticate(other)
+        response = self.client.get("/orders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_product_list_returns_304_for_matching_etag(self):
+        response = self.client.get("/orders/products/")
+        etag = response["ETag"]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        not_modified = self.client.get("/orders/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified["ETag"], etag)
+
+    def test_product_list_etag_changes_after_a_product_write(self):
+        etag = self.client.get("/orders/products/")["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name="Gadget", price=Decimal("5.00"), stock_quantity=3
+            )
+
+        response = self.client.get("/orders/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 2)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class ExportUserOrdersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "buyer@test.com", "password")
+        self.product = Product.objects.create(
+            name="Widget", price=Decimal("10.00"), stock_quantity=5
+        )
+
+    def order(self, quantity):
+        order = Order.objects.create(user=self.user, total=Decimal("10.00") * quantity)
+        OrderItem.objects.create(
+            order=order, product=self.product, quantity=quantity, price=Decimal("10.00")
+        )
+        return order
+
+    def exported_rows(self):
+        (email,) = mail.outbox
+        (attachment,) = email.attachments
+        self.assertEqual(attachment[0], "orders.csv")
+        return list(csv.reader(StringIO(attachment[1])))
+
+    def test_emails_the_history_newest_first(self):
+        older = self.order(1)
+        newer = self.order(2)
+        Order.objects.filter(pk=older.pk).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+
+        tasks.export_user_orders(self.user.id)
+
+        header, *rows = self.exported_rows()
+        self.assertEqual(header[0], "order_id")
+        self.assertEqual([row[0] for row in rows], [str(newer.id), str(older.id)])
+        self.assertEqual(mail.outbox[0].to, ["buyer@test.com"])
+        self.assertNotIn("only the most recent", mail.outbox[0].body)
+
+    def test_caps_the_number_of_exported_lines(self):
+        for quantity in range(1, 4):
+            self.order(quantity)
+
+        with mock.patch("orders.tasks.ORDER_EXPORT_MAX_ROWS", 2):
+            tasks.export_user_orders(self.user.id)
+
+        _, *rows = self.exported_rows()
+        self.assertEqual(len(rows), 2)
+        self.assertIn("only the most recent 2 are included", mail.outbox[0].body)
+
+    def test_missing_user_fails_without_retrying(self):
+        with mock.patch.object(tasks.export_user_orders, "retry") as retry:
+            with self.assertRaises(User.DoesNotExist):
+                tasks.export_user_orders(self.user.id + 1)
+
+        retry.assert_not_called()
+        self.assertEqual(mail.outbox, [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidation_bumps_the_version_on_commit(self):
+        key = product_list_key(50, 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_product_list()
+            self.assertEqual(product_list_key(50, 0), key)
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(product_list_key(50, 0), key)
+
+    def test_product_save_and_delete_bump_the_version(self):
+        first = product_list_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name="Widget", price=Decimal("10.00"), stock_quantity=5
+            )
+        second = product_list_version()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+
+        self.assertLess(first, second)
+        self.assertLess(second, product_list_version())
+
+    def test_lost_version_restarts_ahead_of_cached_pages(self):
+        old_version = product_list_version()
+        cache.delete(PRODUCT_LIST_VERSION_KEY)
+
+        bump_product_list_version()
+
+        self.assertGreater(product_list_version(), old_version)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False)
+class ProductListRebuildLockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Product.objects.create(name="Widget", price=Decimal("10.00"), stock_quantity=5)
+        self.page_key = product_list_key(50, 0)
+        self.lock_key = f"{self.page_key}:lock"
+
+    def test_rebuild_caches_the_page_and_releases_the_lock(self):
+        response = self.client.get("/orders/products/")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(cache.get(self.page_key), response.content)
+        self.assertEqual(cache.get(f"{self.page_key}:etag"), response["ETag"])
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_waiter_uses_the_page_built_by_the_lock_holder(self):
+        cache.set(self.lock_key, 1)
+
+        def lock_holder_finishes(seconds):
+            cache.set_many(
+                {self.page_key: b'{"results": []}', f"{self.page_key}:etag": '"x"'}
+            )
+
+        with mock.patch("orders.views.time.sleep", side_effect=lock_holder_finishes):
+            with self.assertNumQueries(0):
+                response = self.client.get("/orders/products/")
+
+        self.assertEqual(response.content, b'{"results": []}')
+        self.assertEqual(response["ETag"], '"x"')
+
+    def test_waiter_renders_without_caching_when_the_holder_is_slow(self):
+        cache.set(self.lock_key, 1)
+
+        with mock.patch("orders.views.time.sleep") as sleep:
+            response = self.client.get("/orders/products/")
+
+        sleep.assert_called_once()
+        self.assertEqual(response.json()["count"], 1)
+        self.assertIsNone(cache.get(self.page_key))
+        self.assertEqual(cache.get(self.lock_key), 1)
@@ -9,22 +9,23 @@ def log_execution_time(action):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter_ns()
             try:
                 result = func(*args, **kwargs)
-                duration_ms = (time.time() - start_time) * 1000
 
-                logger.info(
-                    f"{action} completed",
-                    extra={
-                        "action": action,
-                        "duration_ms": round(duration_ms, 2),
-                        "status": "success",
-                    },
-                )
+                if logger.isEnabledFor(logging.INFO):
+                    duration_ms = (time.perf_counter_ns() - start_time) / 1_000_000
+                    logger.info(
+                        f"{action} completed",
+                        extra={
+                            "action": action,
+                            "duration_ms": round(duration_ms, 2),
+                            "status": "success",
+                        },
+                    )
                 return result
             except Exception as e:
-                duration_ms = (time.time() - start_time) * 1000
+                duration_ms = (time.perf_counter_ns() - start_time) / 1_000_000
 
                 logger.error(
                     f"{action} failed",
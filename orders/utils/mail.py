@@ -0,0 +1,47 @@
+from smtplib import SMTPServerDisconnected
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+# One connection per worker process, reused across tasks. Prefork workers run
+# a single task at a time, so the connection is never used concurrently.
+_connection = None
+
+
+def get_shared_connection():
+    global _connection
+    if _connection is None:
+        _connection = get_connection()
+    _connection.open()
+    return _connection
+
+
+def close_shared_connection():
+    global _connection
+    if _connection is not None:
+        _connection.close()
+        _connection = None
+
+
+def send_email(subject, message, recipient_list, attachments=None):
+    email = EmailMessage(
+        subject=subject,
+        body=message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+        attachments=attachments,
+        connection=get_shared_connection(),
+    )
+    try:
+        email.send(fail_silently=False)
+    except SMTPServerDisconnected:
+        # The server dropped the idle connection; reconnect once and resend.
+        close_shared_connection()
+        email.connection = get_shared_connection()
+        email.send(fail_silently=False)
+
+
+@worker_process_shutdown.connect
+def close_connection_on_shutdown(**kwargs):
+    close_shared_connection()
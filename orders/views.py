@@ -1,17 +1,29 @@
-import uuid
+import hashlib
+import time
 
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_list_or_404, get_object_or_404
 from django.core.cache import cache
+from django.http import HttpResponse
+from django.db.models import Count, Max
 from rest_framework.views import APIView, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django_ratelimit.decorators import ratelimit
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
 
 from orders import serializers
+from orders.cache import product_list_key
 from orders.models import Order, OrderItem, Product
-from orders.tasks import process_payment_webhook
+from orders.pagination import OrderPagination, ProductPagination
+from orders.tasks import export_user_orders, process_payment_webhook
+
+
+def content_etag(content):
+    return quote_etag(hashlib.md5(content, usedforsecurity=False).hexdigest())
 
 
 @method_decorator(ratelimit(key="user", rate="5/m", method="POST"), name="post")
@@ -20,24 +32,48 @@ class OrderAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, order_id=None):
+        orders = Order.objects.filter(user=request.user).prefetch_related(
+            serializers.order_items_prefetch()
+        )
+
+        # Order items are only written with their order, but their
+        # product_name is read live from Product, so a rename has to change
+        # the ETag as well as any order write.
+        scope = orders.filter(id=order_id) if order_id else orders
+        latest = scope.aggregate(
+            updated_at=Max("updated_at"),
+            product_updated_at=Max("items__product__updated_at"),
+            count=Count("id", distinct=True),
+        )
+        etag = content_etag(
+            f"{request.user.pk}:{request.get_full_path()}:{latest['count']}:"
+            f"{latest['updated_at']}:{latest['product_updated_at']}".encode()
+        )
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
         if order_id:
-            order = get_object_or_404(Order, id=order_id, user=request.user)
+            order = get_object_or_404(orders, id=order_id)
             serializer = serializers.OrderSerializer(order)
-            return Response(status=status.HTTP_200_OK, data=serializer.data)
+            response = Response(status=status.HTTP_200_OK, data=serializer.data)
+        else:
+            paginator = OrderPagination()
+            page = paginator.paginate_queryset(orders, request, view=self)
+            serializer = self.serializer_class(page, many=True)
+            response = paginator.get_paginated_response(serializer.data)
 
-        orders = Order.objects.filter(user=request.user)
-        serializer = self.serializer_class(orders, many=True)
-        return Response(status=status.HTTP_200_OK, data=serializer.data)
+        response["ETag"] = etag
+        return response
 
     def post(self, request):
         serializer = serializers.OrderCreateSerializer(
             data=request.data, context={"request": request}
         )
         if serializer.is_valid():
-            order = serializer.save(user=request.user)
-            return Response(
-                serializers.OrderSerializer(order).data, status=status.HTTP_201_CREATED
-            )
+            serializer.save(user=request.user)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(status=status.HTTP_400_BAD_REQUEST, data=serializer.errors)
 
 
@@ -45,8 +81,13 @@ class OrderItemAPIView(APIView):
     serializer_class = serializers.OrderItemSerializer
 
     def get(self, request, order_id):
-        order = get_object_or_404(Order, id=order_id, user=request.user)
-        items = order.items.all()
+        # Every order has at least one item, so an empty result means the
+        # order does not exist or belongs to someone else.
+        items = get_list_or_404(
+            OrderItem.objects.select_related("product"),
+            order_id=order_id,
+            order__user=request.user,
+        )
         serializer = self.serializer_class(items, many=True)
         return Response(status=status.HTTP_200_OK, data=serializer.data)
 
@@ -60,16 +101,68 @@ class ProductAPIView(APIView):
             serializer = self.serializer_class(product)
             return Response(status=status.HTTP_200_OK, data=serializer.data)
 
-        cache_key = "priduct_list"
-        product_data = cache.get(cache_key)
-
-        if product_data is None:
-            products = Product.objects.filter(is_active=True)
-            serializer = serializers.ProductSerializer(products, many=True)
-            product_data = serializer.data
-            cache.set(cache_key, product_data, timeout=300)
-
-        return Response(status=status.HTTP_200_OK, data=product_data)
+        paginator = ProductPagination()
+        limit = paginator.get_limit(request)
+        offset = paginator.get_offset(request)
+        cache_key = product_list_key(limit, offset)
+        etag_key = f"{cache_key}:etag"
+
+        # The page and its ETag are read and written together in one round trip.
+        cached = cache.get_many([cache_key, etag_key])
+        product_json = cached.get(cache_key)
+        etag = cached.get(etag_key)
+
+        if etag is not None:
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified["ETag"] = etag
+                return not_modified
+
+        if product_json is None:
+            # Only one worker rebuilds a missing page; the others wait briefly
+            # for its result instead of all running the same query.
+            lock_key = f"{cache_key}:lock"
+            if cache.add(lock_key, 1, timeout=10):
+                try:
+                    product_json = self.render_product_page(request, paginator)
+                    etag = content_etag(product_json)
+                    cache.set_many(
+                        {cache_key: product_json, etag_key: etag}, timeout=300
+                    )
+                finally:
+                    cache.delete(lock_key)
+            else:
+                time.sleep(0.05)
+                cached = cache.get_many([cache_key, etag_key])
+                product_json = cached.get(cache_key)
+                etag = cached.get(etag_key)
+                if product_json is None:
+                    product_json = self.render_product_page(request, paginator)
+
+        if etag is None:
+            etag = content_etag(product_json)
+
+        response = HttpResponse(
+            product_json, content_type="application/json", status=status.HTTP_200_OK
+        )
+        response["ETag"] = etag
+        return response
+
+    def render_product_page(self, request, paginator):
+        products = (
+            Product.objects.filter(is_active=True)
+            .values(*self.serializer_class.Meta.fields)
+            .order_by("id")
+        )
+        page = paginator.paginate_queryset(products, request, view=self)
+        # DRF fields read their source from dicts as well as instances, so the
+        # serializer formats the plain rows without building model instances.
+        serializer = self.serializer_class(page, many=True)
+        # The rendered body is what gets cached, so hits skip serialization
+        # and rendering.
+        return JSONRenderer().render(
+            paginator.get_paginated_response(serializer.data).data
+        )
 
     def post(self, request):
         serializer = serializers.ProductSerializer(data=request.data)
@@ -79,12 +172,23 @@ class ProductAPIView(APIView):
         return Response(status=status.HTTP_400_BAD_REQUEST, data=serializer.errors)
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@ratelimit(key="user", rate="5/h", method="POST")
+def export_orders(request):
+    export_user_orders.delay(request.user.id)
+    return Response(
+        {"message": "Your order history will be emailed to you shortly"},
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@ratelimit(key="ip", rate="100/m", method="POST")
 def payment_webhook(request):
     data = request.data
 
-    event_id = data.get("event_id", str(uuid.uuid4()))
     payment_reference = data.get("reference")
     payment_status = data.get("status")
     amount = data.get("amount")
@@ -94,6 +198,29 @@ def payment_webhook(request):
             {"error": "Missing required fields"}, status=status.HTTP_400_BAD_REQUEST
         )
 
-    process_payment_webhook.delay(event_id, payment_reference, payment_status, amount)
+    # Without a provider event id, derive one from the payload so retries of
+    # the same event share a deduplication key.
+    event_id = (
+        data.get("event_id")
+        or hashlib.blake2b(
+            f"{payment_reference}|{payment_status}|{amount}".encode(), digest_size=16
+        ).hexdigest()
+    )
+
+    # Provider retries of an event we already queued are answered from Redis
+    # without another trip through the broker.
+    seen_key = f"webhook:seen:{event_id}"
+    if not cache.add(seen_key, 1, timeout=86400):
+        return Response(
+            {"message": "Webhook already received"}, status=status.HTTP_200_OK
+        )
+
+    try:
+        process_payment_webhook.delay(
+            event_id, payment_reference, payment_status, amount
+        )
+    except Exception:
+        cache.delete(seen_key)
+        raise
 
     return Response({"message": "Webhook received"}, status=status.HTTP_200_OK)